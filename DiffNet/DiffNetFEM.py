@@ -181,6 +181,16 @@ class DiffNet2DFEM(DiffNetFEM):
                 self.d2N_x_gp.append(nn.Parameter(d2N_x_gp.unsqueeze(0).unsqueeze(1), requires_grad=False))
                 self.d2N_y_gp.append(nn.Parameter(d2N_y_gp.unsqueeze(0).unsqueeze(1), requires_grad=False))
                 self.d2N_xy_gp.append(nn.Parameter(d2N_xy_gp.unsqueeze(0).unsqueeze(1), requires_grad=False))
+        # x and y derivative kernels of all gauss points stacked along the output channels;
+        # derived from dN_x_gp/dN_y_gp, so it is kept out of the state_dict
+        self.register_buffer('dN_grad_gp', torch.cat(list(self.dN_x_gp) + list(self.dN_y_gp), 0).detach(), persistent=False)
+
+    def gauss_pt_grad(self, tensor):
+        """
+        Evaluates both gauss_pt_evaluation_der_x and gauss_pt_evaluation_der_y with one convolution
+        """
+        grad_gp = nn.functional.conv2d(tensor, self.dN_grad_gp, stride=(self.nbf_1d-1))
+        return torch.split(grad_gp, self.ngp_total, 1)
 
 
 
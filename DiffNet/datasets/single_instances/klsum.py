@@ -15,12 +15,12 @@ class Dataset(data.Dataset):
         else:
             raise FileNotFoundError("Single instance: Wrong path to coefficient file.")
         self.domain_size = domain_size
-        self.nu = generate_diffusivity_tensor(self.coeff, output_size=self.domain_size).squeeze()
+        self.nu = generate_diffusivity_tensor(self.coeff, output_size=self.domain_size).squeeze().astype(np.float32)
         # bc1 will be source, u will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc1[:,0] = 1
         # bc2 will be sink, u will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[:,-1] = 1
         self.n_samples = 1000        
 
@@ -32,4 +32,4 @@ class Dataset(data.Dataset):
         'Generates one sample of data'
         inputs = np.array([self.nu, self.bc1, self.bc2])
         forcing = np.zeros_like(self.nu)
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)        
+        return torch.from_numpy(inputs), torch.from_numpy(forcing).unsqueeze(0)        
@@ -10,14 +10,20 @@ class Rectangle(data.Dataset):
         """
         Initialization
         """
-        self.domain = np.ones((domain_size, domain_size))
+        self.domain = np.ones((domain_size, domain_size), dtype=np.float32)
         # bc1 will be source, u will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc1[0,:] = 1
         # bc2 will be sink, u will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[-1,:] = 1
+        self.bc1_mask = torch.from_numpy(self.bc1 > 0.5)
+        self.bc2_mask = torch.from_numpy(self.bc2 > 0.5)
         self.n_samples = 6000
+        # the sample is identical for every index, so build the tensors once
+        inputs = np.stack([self.domain, self.bc1, self.bc2]).astype(np.float32)
+        self._inputs = torch.from_numpy(inputs)
+        self._forcing = torch.zeros(1, domain_size, domain_size, dtype=torch.float32)
         
 
     def __len__(self):
@@ -26,9 +32,7 @@ class Rectangle(data.Dataset):
 
     def __getitem__(self, index):
         'Generates one sample of data'
-        inputs = np.array([self.domain, self.bc1, self.bc2])
-        forcing = np.zeros_like(self.domain)
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        return self._inputs, self._forcing
 
 
 
@@ -38,18 +42,18 @@ class RectangleManufactured(data.Dataset):
         """
         Initialization
         """
-        self.domain = np.ones((domain_size, domain_size))
+        self.domain = np.ones((domain_size, domain_size), dtype=np.float32)
         # bc1 will be source, u will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         # bc2 will be sink, u will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[-1,:] = 1
         self.bc2[0,:] = 1
         self.bc2[:,0] = 1
         self.bc2[:,-1] = 1
         self.n_samples = 100
-        x = np.linspace(0,1,domain_size)
-        y = np.linspace(0,1,domain_size)
+        x = np.linspace(0,1,domain_size,dtype=np.float32)
+        y = np.linspace(0,1,domain_size,dtype=np.float32)
         xx, yy = np.meshgrid(x,y)
         self.forcing = 2. * math.pi**2 * np.sin(math.pi * xx) * np.sin(math.pi * yy)
         
@@ -62,7 +66,7 @@ class RectangleManufactured(data.Dataset):
         'Generates one sample of data'
         inputs = np.array([self.domain, self.bc1, self.bc2])
         forcing = self.forcing
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        return torch.from_numpy(inputs), torch.from_numpy(forcing).unsqueeze(0)
 
 class RectangleManufacturedNonZeroBC(data.Dataset):
     'PyTorch dataset for sampling coefficients'
@@ -70,18 +74,18 @@ class RectangleManufacturedNonZeroBC(data.Dataset):
         """
         Initialization
         """
-        self.domain = np.ones((domain_size, domain_size))
+        self.domain = np.ones((domain_size, domain_size), dtype=np.float32)
         # bc1 will be source, u will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc1[:,0] = 1
         self.bc1[:,-1] = 1
         # bc2 will be sink, u will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[-1,:] = 1
         self.bc2[0,:] = 1
         self.n_samples = 100
-        x = np.linspace(0,1,domain_size)
-        y = np.linspace(0,1,domain_size)
+        x = np.linspace(0,1,domain_size,dtype=np.float32)
+        y = np.linspace(0,1,domain_size,dtype=np.float32)
         xx, yy = np.meshgrid(x,y)
         self.xx = xx
         self.yy = yy
@@ -98,7 +102,7 @@ class RectangleManufacturedNonZeroBC(data.Dataset):
         'Generates one sample of data'
         inputs = np.array([self.domain, self.bc1, self.bc2])
         forcing = self.forcing
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        return torch.from_numpy(inputs), torch.from_numpy(forcing).unsqueeze(0)
 
 class RectangleHelmholtzManufactured(data.Dataset):
     'PyTorch dataset for sampling coefficients'
@@ -107,18 +111,18 @@ class RectangleHelmholtzManufactured(data.Dataset):
         Initialization
         """
         self.khh = 0.5
-        self.domain = np.ones((domain_size, domain_size))
+        self.domain = np.ones((domain_size, domain_size), dtype=np.float32)
         # bc1 will be source, u will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         # bc2 will be sink, u will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[-1,:] = 1
         self.bc2[0,:] = 1
         self.bc2[:,0] = 1
         self.bc2[:,-1] = 1
         self.n_samples = 100
-        x = np.linspace(0,1,domain_size)
-        y = np.linspace(0,1,domain_size)
+        x = np.linspace(0,1,domain_size,dtype=np.float32)
+        y = np.linspace(0,1,domain_size,dtype=np.float32)
         xx, yy = np.meshgrid(x,y)
         self.forcing = (2. * math.pi**2 - self.khh**2) * np.sin(math.pi * xx) * np.sin(math.pi * yy)
 
@@ -131,7 +135,7 @@ class RectangleHelmholtzManufactured(data.Dataset):
         'Generates one sample of data'
         inputs = np.array([self.domain, self.bc1, self.bc2])
         forcing = self.forcing
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        return torch.from_numpy(inputs), torch.from_numpy(forcing).unsqueeze(0)
 
 class RectangleHelmholtzDeltaForce(data.Dataset):
     'PyTorch dataset for sampling coefficients'
@@ -140,18 +144,18 @@ class RectangleHelmholtzDeltaForce(data.Dataset):
         Initialization
         """
         self.khh = 1./8.
-        self.domain = np.ones((domain_size, domain_size))
+        self.domain = np.ones((domain_size, domain_size), dtype=np.float32)
         # bc1 will be source, u will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         # bc2 will be sink, u will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[-1,:] = 1
         self.bc2[0,:] = 1
         self.bc2[:,0] = 1
         self.bc2[:,-1] = 1
         self.n_samples = 100
-        x = np.linspace(0,1,domain_size)
-        y = np.linspace(0,1,domain_size)
+        x = np.linspace(0,1,domain_size,dtype=np.float32)
+        y = np.linspace(0,1,domain_size,dtype=np.float32)
         xx, yy = np.meshgrid(x,y)
 
         mu1 = 0.1875
@@ -168,7 +172,7 @@ class RectangleHelmholtzDeltaForce(data.Dataset):
         'Generates one sample of data'
         inputs = np.array([self.domain, self.bc1, self.bc2])
         forcing = self.forcing
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        return torch.from_numpy(inputs), torch.from_numpy(forcing).unsqueeze(0)
 
 class RectangleManufacturedStokes(data.Dataset):
     'PyTorch dataset for sampling coefficients'
@@ -176,20 +180,20 @@ class RectangleManufacturedStokes(data.Dataset):
         """
         Initialization
         """
-        self.domain = np.ones((domain_size, domain_size))
+        self.domain = np.ones((domain_size, domain_size), dtype=np.float32)
         # bc1 will be source, ux will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         # bc2 will be sink, ux will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         # bc3 will be source, uy will be set to 1 at these locations
-        self.bc3 = np.zeros((domain_size, domain_size))
+        self.bc3 = np.zeros((domain_size, domain_size), dtype=np.float32)
         # bc4 will be sink, uy will be set to 0 at these locations
-        self.bc4 = np.zeros((domain_size, domain_size))
+        self.bc4 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[-1,:] = 1
         self.bc2[0,:] = 1
         self.n_samples = 100
-        x = np.linspace(0,1,domain_size)
-        y = np.linspace(0,1,domain_size)
+        x = np.linspace(0,1,domain_size,dtype=np.float32)
+        y = np.linspace(0,1,domain_size,dtype=np.float32)
         xx, yy = np.meshgrid(x,y)
         self.forcing = 2. * math.pi**2 * np.sin(math.pi * xx) * np.sin(math.pi * yy)
         
@@ -202,7 +206,7 @@ class RectangleManufacturedStokes(data.Dataset):
         'Generates one sample of data'
         inputs = np.array([self.domain, self.bc1, self.bc2])
         forcing = self.forcing
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        return torch.from_numpy(inputs), torch.from_numpy(forcing).unsqueeze(0)
 
 
 
@@ -214,16 +218,17 @@ class RectangleIM(data.Dataset):
         Initialization
         """
 
-        self.domain = np.zeros((domain_size, domain_size))
+        self.domain = np.zeros((domain_size, domain_size), dtype=np.float32)
         rect_params = [10,10,30,50] # x, y, w, h
         self.domain[rect_params[1]:rect_params[1]+rect_params[3],rect_params[0]:rect_params[0]+rect_params[2]] = 1.0
 
         # bc1 will be source, u will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc1[rect_params[1],rect_params[0]:rect_params[0]+rect_params[2]] = 1
         # bc2 will be sink, u will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[rect_params[1]+rect_params[3],rect_params[0]:rect_params[0]+rect_params[2]] = 1
+        self.forcing = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.n_samples = 200        
 
     def __len__(self):
@@ -233,8 +238,8 @@ class RectangleIM(data.Dataset):
     def __getitem__(self, index):
         'Generates one sample of data'
         inputs = np.array([self.domain, self.bc1, self.bc2])
-        forcing = np.zeros_like(self.domain)
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        forcing = self.forcing
+        return torch.from_numpy(inputs), torch.from_numpy(forcing).unsqueeze(0)
 
 class RectangleIMBack(data.Dataset):
     'PyTorch dataset for sampling coefficients'
@@ -243,19 +248,20 @@ class RectangleIMBack(data.Dataset):
         Initialization
         """
         
-        self.domain = np.ones((domain_size, domain_size))
+        self.domain = np.ones((domain_size, domain_size), dtype=np.float32)
         rect_params = [10,10,30,20] # x, y, w, h
         self.domain[rect_params[1]:rect_params[1]+rect_params[3],rect_params[0]:rect_params[0]+rect_params[2]] = 0.0
 
         # bc1 will be source, u will be set to 1 at these locations
-        self.bc1 = np.zeros((domain_size, domain_size))
+        self.bc1 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc1[rect_params[1]:rect_params[1]+rect_params[3],rect_params[0]:rect_params[0]+rect_params[2]] = 1.0
         # bc2 will be sink, u will be set to 0 at these locations
-        self.bc2 = np.zeros((domain_size, domain_size))
+        self.bc2 = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.bc2[0,:] = 1
         self.bc2[-1,:] = 1
         self.bc2[:,0] = 1
         self.bc2[:,-1] = 1
+        self.forcing = np.zeros((domain_size, domain_size), dtype=np.float32)
         self.n_samples = 200
 
     def __len__(self):
@@ -265,5 +271,5 @@ class RectangleIMBack(data.Dataset):
     def __getitem__(self, index):
         'Generates one sample of data'
         inputs = np.array([self.domain, self.bc1, self.bc2])
-        forcing = np.zeros_like(self.domain)
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        forcing = self.forcing
+        return torch.from_numpy(inputs), torch.from_numpy(forcing).unsqueeze(0)
@@ -53,6 +53,10 @@ class LDC(data.Dataset):
         self.bc3 = np.zeros_like(xx)
         self.bc3[0:1,0:1] = 1.0
 
+        self.bc1_mask = torch.from_numpy(self.bc1 >= 0.5)
+        self.bc2_mask = torch.from_numpy(self.bc2 >= 0.5)
+        self.bc3_mask = torch.from_numpy(self.bc3 >= 0.5)
+
         self.Re = Re
         self.n_samples = 100
 
@@ -73,6 +77,10 @@ class Stokes(DiffNet2DFEM):
     """docstring for Eiqonal"""
     def __init__(self, network, dataset, **kwargs):
         super(Stokes, self).__init__(network, dataset, **kwargs)
+        self.register_buffer('bc1_mask', dataset.bc1_mask[None, None], persistent=False)
+        self.register_buffer('bc2_mask', dataset.bc2_mask[None, None], persistent=False)
+        self.register_buffer('bc3_mask', dataset.bc3_mask[None, None], persistent=False)
+        self.register_buffer('bc12_mask', self.bc1_mask | self.bc2_mask, persistent=False)
 
     def loss(self, pred, inputs_tensor, forcing_tensor):
 
@@ -82,20 +90,14 @@ class Stokes(DiffNet2DFEM):
         v = pred[:,1:2,:,:]
         p = pred[:,2:3,:,:]
 
-        # extract diffusivity and boundary conditions here
-        x = inputs_tensor[:,0:1,:,:]
-        bc1 = inputs_tensor[:,1:2,:,:]
-        bc2 = inputs_tensor[:,2:3,:,:]
-        bc3 = inputs_tensor[:,3:4,:,:]
-
         # apply boundary conditions
-        u = torch.where(bc1>=0.5, u*0.0, u)
-        u = torch.where(bc2>=0.5, u*0.0 + 1.0, u)
-        # u = torch.where(bc2>=0.5, u*0.0 + 4.0*x*(1-x), u)
+        u = u.masked_fill(self.bc1_mask, 0.0)
+        u = u.masked_fill(self.bc2_mask, 1.0)
+        # u = torch.where(self.bc2_mask, 4.0*x*(1-x), u)
 
-        v = torch.where(torch.logical_or((bc1>=0.5),(bc2>=0.5)), v*0.0, v)
+        v = v.masked_fill(self.bc12_mask, 0.0)
 
-        p = torch.where(bc3>=0.5, p*0.0, p)
+        p = p.masked_fill(self.bc3_mask, 0.0)
 
         u_gp = self.gauss_pt_evaluation(u)
         v_gp = self.gauss_pt_evaluation(v)
@@ -147,24 +149,16 @@ class Stokes(DiffNet2DFEM):
 
         pred, inputs_tensor, forcing_tensor = self.forward((inputs.unsqueeze(0).type_as(next(self.network.parameters())), forcing.unsqueeze(0).type_as(next(self.network.parameters()))))
 
-        f = forcing_tensor # renaming variable
-        
         u = pred[:,0:1,:,:]
         v = pred[:,1:2,:,:]
         p = pred[:,2:3,:,:]
 
-        # extract diffusivity and boundary conditions here
-        x = inputs_tensor[:,0:1,:,:]
-        bc1 = inputs_tensor[:,1:2,:,:]
-        bc2 = inputs_tensor[:,2:3,:,:]
-        bc3 = inputs_tensor[:,3:4,:,:]
-
         # apply boundary conditions
-        u = torch.where(bc1>=0.05, u*0.0, u)
-        u = torch.where(bc2>=0.05, u*0.0 + 1.0, u)
+        u = u.masked_fill(self.bc1_mask, 0.0)
+        u = u.masked_fill(self.bc2_mask, 1.0)
 
-        v = torch.where(torch.logical_or((bc1>=0.5),(bc2>=0.5)), v*0.0, v)
-        p = torch.where(bc3>=0.5, p*0.0, p)
+        v = v.masked_fill(self.bc12_mask, 0.0)
+        p = p.masked_fill(self.bc3_mask, 0.0)
 
         u_x = self.gauss_pt_evaluation_der_x(u)[:,0,:,:].squeeze().detach().cpu()
         v_y = self.gauss_pt_evaluation_der_y(v)[:,0,:,:].squeeze().detach().cpu()
@@ -172,8 +166,6 @@ class Stokes(DiffNet2DFEM):
         u = u.squeeze().detach().cpu()
         v = v.squeeze().detach().cpu()
         p = p.squeeze().detach().cpu()
-        bc1 = bc1.squeeze().detach().cpu()
-        bc2 = bc2.squeeze().detach().cpu()
 
         div = u_x + v_y
 
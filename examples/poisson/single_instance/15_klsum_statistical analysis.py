@@ -1,29 +1,22 @@
 import os
-import sys
-import json
 import torch
+import concurrent.futures
 import numpy as np
 
-import matplotlib
-# matplotlib.use("pgf")
-matplotlib.rcParams.update({
-    # 'font.family': 'serif',
-    'font.size':12,
-})
-from matplotlib import pyplot as plt
-
 import pytorch_lightning as pl
 from pytorch_lightning import Trainer, seed_everything
-from pytorch_lightning.loggers import TensorBoardLogger
 seed_everything(42)
 
-import DiffNet
-from DiffNet.networks.wgan import GoodNetwork
 from DiffNet.DiffNetFEM import DiffNet2DFEM
 
 from torch.utils import data
 from DiffNet.gen_input_calc import generate_diffusivity_tensor
 
+def _residual(nu_gp, f_gp, u_gp, u_x_gp, u_y_gp, gpw):
+    res_elmwise = gpw * (nu_gp * (u_x_gp**2 + u_y_gp**2) - (u_gp * f_gp))
+    res_elmwise = torch.sum(res_elmwise, 1)
+    return torch.mean(res_elmwise)
+
 class Dataset(data.Dataset):
     'PyTorch dataset for sampling coefficients'
     def __init__(self, coeff, domain_size=64):
@@ -32,7 +25,6 @@ class Dataset(data.Dataset):
         """
         self.coeff = coeff
         self.domain_size = domain_size
-        self.n_samples = 1000
         self.nu = generate_diffusivity_tensor(self.coeff, output_size=self.domain_size).squeeze()
         # bc1 will be source, u will be set to 1 at these locations
         self.bc1 = np.zeros((domain_size, domain_size))
@@ -40,7 +32,13 @@ class Dataset(data.Dataset):
         # bc2 will be sink, u will be set to 0 at these locations
         self.bc2 = np.zeros((domain_size, domain_size))
         self.bc2[:,-1] = 1
-        self.n_samples = 100        
+        self.bc1_mask = torch.from_numpy(self.bc1 > 0.5)
+        self.bc2_mask = torch.from_numpy(self.bc2 > 0.5)
+        self.n_samples = 100
+        # the sample is identical for every index, so build the tensors once
+        inputs = np.stack([self.nu, self.bc1, self.bc2]).astype(np.float32)
+        self._inputs = torch.from_numpy(inputs)
+        self._forcing = torch.zeros(1, domain_size, domain_size, dtype=torch.float32)
 
     def __len__(self):
         'Denotes the total number of samples'
@@ -48,89 +46,128 @@ class Dataset(data.Dataset):
 
     def __getitem__(self, index):
         'Generates one sample of data'
-        inputs = np.array([self.nu, self.bc1, self.bc2])
-        forcing = np.zeros_like(self.nu)
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)        
+        return self._inputs, self._forcing
 
 
 class Poisson(DiffNet2DFEM):
     """docstring for Poisson"""
     def __init__(self, network, dataset, **kwargs):
         super(Poisson, self).__init__(network, dataset, **kwargs)
-
-    def loss(self, u, inputs_tensor, forcing_tensor):
-
-        f = forcing_tensor # renaming variable
-        
-        # extract diffusivity and boundary conditions here
-        nu = inputs_tensor[:,0:1,:,:]
-        bc1 = inputs_tensor[:,1:2,:,:]
-        bc2 = inputs_tensor[:,2:3,:,:]
+        # use_compile=True fuses _residual with torch.compile (PyTorch >= 2.0); eager by default
+        self.use_compile = kwargs.get('use_compile', False)
+        self._residual = torch.compile(_residual, mode="reduce-overhead", dynamic=False) if self.use_compile else _residual
+        self.plot_every = kwargs.get('plot_every', 50)
+        self._plot_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._plot_futures = []
+        self._last_plot_epoch = None
+        # figure, axes and images are created on the first plot and redrawn in place afterwards
+        self._plot_fig, self._plot_axs, self._plot_ims = None, None, None
+        # diffusivity and BCs are fixed for a given coeff; buffers follow the module to the GPU
+        inputs, forcing = dataset[0]
+        self.register_buffer('nu', inputs[None,0:1,:,:].contiguous(), persistent=False)
+        self.register_buffer('forcing_tensor', forcing.unsqueeze(0), persistent=False)
+        self.register_buffer('bc1_mask', dataset.bc1_mask[None, None], persistent=False)
+        self.register_buffer('bc2_mask', dataset.bc2_mask[None, None], persistent=False)
+        self.register_buffer('gpw_bcast', self.gpw.view(1, -1, 1, 1).float(), persistent=False)
+
+    def loss(self, u):
+
+        f = self.forcing_tensor # renaming variable
+        nu = self.nu
 
         # apply boundary conditions
-        u = torch.where(bc1>0.5,1.0+u*0.0,u)
-        u = torch.where(bc2>0.5,u*0.0,u)
-
+        u = u.masked_fill(self.bc1_mask, 1.0)
+        u = u.masked_fill(self.bc2_mask, 0.0)
 
         nu_gp = self.gauss_pt_evaluation(nu)
         f_gp = self.gauss_pt_evaluation(f)
         u_gp = self.gauss_pt_evaluation(u)
-        u_x_gp = self.gauss_pt_evaluation_der_x(u)
-        u_y_gp = self.gauss_pt_evaluation_der_y(u)
+        u_x_gp, u_y_gp = self.gauss_pt_grad(u)
 
-        transformation_jacobian = self.gpw.unsqueeze(-1).unsqueeze(-1).unsqueeze(0).type_as(nu_gp)
-        res_elmwise = transformation_jacobian * (nu_gp * (u_x_gp**2 + u_y_gp**2) - (u_gp * f_gp))
-        res_elmwise = torch.sum(res_elmwise, 1) 
+        return self._residual(nu_gp, f_gp, u_gp, u_x_gp, u_y_gp, self.gpw_bcast)
 
-        loss = torch.mean(res_elmwise)
-        return loss
+    def training_step(self, batch, batch_idx):
+        loss_val = self.loss(self.network[0])
+        self.log('PDE_loss', loss_val.item())
+        self.log('loss', loss_val.item())
+        return loss_val
 
-    def forward(self, batch):
-        inputs_tensor, forcing_tensor = batch
-        return self.network[0], inputs_tensor, forcing_tensor
+    def train_dataloader(self):
+        """
+        Yields only sample indices, one LBFGS step each; training_step reads the registered buffers instead
+        """
+        return data.DataLoader(range(len(self.dataset)))
 
     def configure_optimizers(self):
         """
         Configure optimizer for network parameters
         """
         lr = self.learning_rate
-        opts = [torch.optim.LBFGS(self.network, lr=1.0, max_iter=5)]
+        opts = [torch.optim.LBFGS(self.network, lr=1.0, max_iter=5, line_search_fn="strong_wolfe",
+                                   tolerance_grad=1e-5, tolerance_change=1e-7)]
         return opts, []
 
     def on_epoch_end(self):
-        fig, axs = plt.subplots(1, 2, figsize=(2*2,1.2),
-                            subplot_kw={'aspect': 'auto'}, sharex=True, sharey=True, squeeze=True)
-        for ax in axs:
-            ax.set_xticks([])
-            ax.set_yticks([])
-        self.network.eval()
-        inputs, forcing = self.dataset[0]
+        if self.current_epoch % self.plot_every != 0 and self.current_epoch != self.trainer.max_epochs - 1:
+            return
+        self.submit_plots()
 
-        u, inputs_tensor, forcing_tensor = self.forward((inputs.unsqueeze(0).type_as(next(self.network.parameters())), forcing.unsqueeze(0).type_as(next(self.network.parameters()))))
-
-        f = forcing_tensor # renaming variable
-        
-        # extract diffusivity and boundary conditions here
-        nu = inputs_tensor[:,0:1,:,:]
-        bc1 = inputs_tensor[:,1:2,:,:]
-        bc2 = inputs_tensor[:,2:3,:,:]
+    def submit_plots(self):
+        self._last_plot_epoch = self.current_epoch
+        self.network.eval()
+        u = self.network[0]
+        nu = self.nu
 
         # apply boundary conditions
-        u = torch.where(bc1>0.5,1.0+u*0.0,u)
-        u = torch.where(bc2>0.5,u*0.0,u)
+        u = u.masked_fill(self.bc1_mask, 1.0)
+        u = u.masked_fill(self.bc2_mask, 0.0)
 
 
 
         k = nu.squeeze().detach().cpu()
         u = u.squeeze().detach().cpu()
 
-        im0 = axs[0].imshow(k,cmap='jet')
-        fig.colorbar(im0, ax=axs[0])
-        im1 = axs[1].imshow(u,cmap='jet')
-        fig.colorbar(im1, ax=axs[1])  
-        plt.savefig(os.path.join(self.logger[0].log_dir, 'contour_' + str(self.current_epoch) + '.png'))
-        self.logger[0].experiment.add_figure('Contour Plots', fig, self.current_epoch)
-        plt.close('all')
+        self._plot_futures.append(self._plot_executor.submit(self.plot_contours, self.current_epoch, k, u))
+
+    def plot_contours(self, epoch, k, u):
+        # imported here so that runs which never plot skip loading matplotlib
+        import matplotlib
+        # matplotlib.use("pgf")
+        matplotlib.rcParams.update({
+            # 'font.family': 'serif',
+            'font.size':12,
+        })
+        # a bare Figure needs no pyplot/GUI backend, so it is safe on the plotting thread
+        from matplotlib.figure import Figure
+
+        if self._plot_fig is None:
+            fig = Figure(figsize=(2*2,1.2))
+            axs = fig.subplots(1, 2, subplot_kw={'aspect': 'auto'}, sharex=True, sharey=True, squeeze=True)
+            for ax in axs:
+                ax.set_xticks([])
+                ax.set_yticks([])
+
+            im0 = axs[0].imshow(k,cmap='jet')
+            fig.colorbar(im0, ax=axs[0])
+            im1 = axs[1].imshow(u,cmap='jet')
+            fig.colorbar(im1, ax=axs[1])  
+            self._plot_fig, self._plot_axs, self._plot_ims = fig, axs, [im0, im1]
+        else:
+            for im, field in zip(self._plot_ims, (k, u)):
+                im.set_data(field)
+                im.autoscale()
+
+        fig = self._plot_fig
+        fig.savefig(os.path.join(self.logger[0].log_dir, 'contour_' + str(epoch) + '.png'))
+        self.logger[0].experiment.add_figure('Contour Plots', fig, epoch, close=False)
+
+    def on_train_end(self):
+        # the last epoch is rarely a multiple of plot_every once early stopping kicks in
+        if self._last_plot_epoch != self.current_epoch:
+            self.submit_plots()
+        for future in self._plot_futures:
+            future.result()
+        self._plot_executor.shutdown(wait=True)
 
 def main():
 
@@ -157,7 +194,7 @@ def main():
 
         trainer = Trainer(gpus=[0],callbacks=[early_stopping],
             checkpoint_callback=checkpoint, logger=[logger,csv_logger],
-            max_epochs=5, deterministic=True, profiler="simple")
+            max_epochs=5, deterministic=False, benchmark=True, profiler="simple")
 
         # ------------------------
         # 4 Training
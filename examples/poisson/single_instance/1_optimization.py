@@ -27,19 +27,19 @@ class Poisson(DiffNet2DFEM):
     """docstring for Poisson"""
     def __init__(self, network, dataset, **kwargs):
         super(Poisson, self).__init__(network, dataset, **kwargs)
+        self.register_buffer('bc1_mask', dataset.bc1_mask[None, None], persistent=False)
+        self.register_buffer('bc2_mask', dataset.bc2_mask[None, None], persistent=False)
 
     def loss(self, u, inputs_tensor, forcing_tensor):
 
         f = forcing_tensor # renaming variable
         
-        # extract diffusivity and boundary conditions here
+        # extract diffusivity here
         nu = inputs_tensor[:,0:1,:,:]
-        bc1 = inputs_tensor[:,1:2,:,:]
-        bc2 = inputs_tensor[:,2:3,:,:]
 
         # apply boundary conditions
-        u = torch.where(bc1>0.5,1.0+u*0.0,u)
-        u = torch.where(bc2>0.5,u*0.0,u)
+        u = u.masked_fill(self.bc1_mask, 1.0)
+        u = u.masked_fill(self.bc2_mask, 0.0)
 
 
         nu_gp = self.gauss_pt_evaluation(nu)
@@ -80,14 +80,12 @@ class Poisson(DiffNet2DFEM):
 
         f = forcing_tensor # renaming variable
         
-        # extract diffusivity and boundary conditions here
+        # extract diffusivity here
         nu = inputs_tensor[:,0:1,:,:]
-        bc1 = inputs_tensor[:,1:2,:,:]
-        bc2 = inputs_tensor[:,2:3,:,:]
 
         # apply boundary conditions
-        u = torch.where(bc1>0.5,1.0+u*0.0,u)
-        u = torch.where(bc2>0.5,u*0.0,u)
+        u = u.masked_fill(self.bc1_mask, 1.0)
+        u = u.masked_fill(self.bc2_mask, 0.0)
 
 
 
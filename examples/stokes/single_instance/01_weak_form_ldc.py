@@ -1,30 +1,32 @@
 import os
-import sys
-import math
-import json
 import torch
+import concurrent.futures
 import numpy as np
 
-import scipy.io
-from scipy import ndimage
 import matplotlib
-from skimage import io
 # matplotlib.use("pgf")
 matplotlib.rcParams.update({
     # 'font.family': 'serif',
     'font.size':12,
 })
-from matplotlib import pyplot as plt
+# figures are built without pyplot so they can be drawn off the main thread with any default backend
+from matplotlib.figure import Figure
 
 import pytorch_lightning as pl
 from pytorch_lightning import Trainer, seed_everything
-from pytorch_lightning.loggers import TensorBoardLogger
 seed_everything(42)
 
-import DiffNet
 from DiffNet.DiffNetFEM import DiffNet2DFEM
 from torch.utils import data
 
+def _residual(f_gp, p_gp, p_x_gp, u_x_gp, u_y_gp, v_x_gp, v_y_gp, gpw):
+    res_elmwise1 = gpw * ((u_x_gp**2 + u_y_gp**2 + v_x_gp**2 + v_y_gp**2)*f_gp - p_gp*(u_x_gp + v_y_gp))**2
+    # res_elmwise1 = gpw * ((u_x_gp**2 + v_y_gp**2)*f_gp - p_gp*(u_x_gp + v_y_gp))**2
+    # res_elmwise2 = gpw * ((u_x_gp + v_y_gp))**2
+    res_elmwise2 = gpw * ((p_gp*(u_x_gp + v_y_gp))**2 + 0.01*p_x_gp**2)
+
+    res_elmwise = torch.sum(res_elmwise1, 1) + 100*torch.sum(res_elmwise2, 1)
+    return torch.mean(res_elmwise)
 
 
 class LDC(data.Dataset):
@@ -35,26 +37,34 @@ class LDC(data.Dataset):
         """
 
         x = np.linspace(0, 1, domain_size)
-        y = np.linspace(0, 1, domain_size)
 
-        xx , yy = np.meshgrid(x, y)
-        self.x = xx
-        self.y = yy
+        # one (4, H, W) buffer holding x, bc1, bc2, bc3; the attributes below are views into it
+        self.inputs = np.zeros((4, domain_size, domain_size), dtype=np.float32)
+        self.x = self.inputs[0]
+        self.x[:] = x # broadcast along rows, same as the x output of meshgrid
         # bc1 for fixed boundaries
-        self.bc1 = np.zeros_like(xx)
+        self.bc1 = self.inputs[1]
         self.bc1[:,0:1] = 1.0
         self.bc1[:,-1:] = 1.0
         self.bc1[0:1,:] = 1.0
 
-        self.bc2 = np.zeros_like(xx)
-        self.bc2_val = np.zeros_like(xx)
+        self.bc2 = self.inputs[2]
         self.bc2[-1:,:] = 1.0
 
-        self.bc3 = np.zeros_like(xx)
+        self.bc3 = self.inputs[3]
         self.bc3[0:1,0:1] = 1.0
 
+        self.bc1_mask = torch.from_numpy(self.bc1 >= 0.5)
+        self.bc2_mask = torch.from_numpy(self.bc2 >= 0.5)
+        self.bc3_mask = torch.from_numpy(self.bc3 >= 0.5)
+
         self.Re = Re
+        # every sample is the same field, but each one is an optimizer step per epoch
         self.n_samples = 100
+        # the sample is identical for every index, so build the tensors once
+        self.forcing = np.full((1, domain_size, domain_size), 1.0/self.Re, dtype=np.float32)
+        self._inputs = torch.from_numpy(self.inputs)
+        self._forcing = torch.from_numpy(self.forcing)
 
 
     def __len__(self):
@@ -63,71 +73,82 @@ class LDC(data.Dataset):
 
     def __getitem__(self, index):
         'Generates one sample of data'
-        inputs = np.array([self.x, self.bc1, self.bc2, self.bc3])
-
-        forcing = np.ones_like(self.x)*(1/self.Re)
-        return torch.FloatTensor(inputs), torch.FloatTensor(forcing).unsqueeze(0)
+        return self._inputs, self._forcing
 
 
 class Stokes(DiffNet2DFEM):
     """docstring for Eiqonal"""
     def __init__(self, network, dataset, **kwargs):
         super(Stokes, self).__init__(network, dataset, **kwargs)
-
-    def loss(self, pred, inputs_tensor, forcing_tensor):
-
-        f = forcing_tensor # renaming variable
+        # opt-in fusion of the elementwise residual; needs PyTorch >= 2.0 with a working Inductor/Triton
+        self.use_compile = kwargs.get('use_compile', False)
+        self._residual = torch.compile(_residual, mode="reduce-overhead", dynamic=False) if self.use_compile else _residual
+        self.plot_every = kwargs.get('plot_every', 50)
+        # figures are drawn off the training thread, one at a time
+        self._plot_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._plot_futures = []
+        self._last_plot_epoch = None
+        # reused across epochs: contour figure/axes/images and the linecut figure/line
+        self._plot_fig, self._plot_axs, self._plot_ims = None, None, None
+        self._cut_fig, self._cut_line = None, None
+        # the inputs never change, so keep them on the module and let Lightning move them to the device
+        inputs, forcing = dataset[0]
+        self.register_buffer('inputs_tensor', inputs.unsqueeze(0), persistent=False)
+        self.register_buffer('forcing_tensor', forcing.unsqueeze(0), persistent=False)
+        self.register_buffer('bc1_mask', dataset.bc1_mask[None, None], persistent=False)
+        self.register_buffer('bc2_mask', dataset.bc2_mask[None, None], persistent=False)
+        self.register_buffer('bc3_mask', dataset.bc3_mask[None, None], persistent=False)
+        self.register_buffer('bc12_mask', self.bc1_mask | self.bc2_mask, persistent=False)
+        # gauss point weights in the (1, ngp, 1, 1) shape the residual broadcasts against
+        self.register_buffer('gpw_bcast', self.gpw.view(1, -1, 1, 1).float(), persistent=False)
+
+    def loss(self, pred):
+
+        f = self.forcing_tensor # renaming variable
         
         u = pred[:,0:1,:,:]
         v = pred[:,1:2,:,:]
         p = pred[:,2:3,:,:]
 
-        # extract diffusivity and boundary conditions here
-        x = inputs_tensor[:,0:1,:,:]
-        bc1 = inputs_tensor[:,1:2,:,:]
-        bc2 = inputs_tensor[:,2:3,:,:]
-        bc3 = inputs_tensor[:,3:4,:,:]
-
         # apply boundary conditions
-        u = torch.where(bc1>=0.5, u*0.0, u)
-        u = torch.where(bc2>=0.5, u*0.0 + 1.0, u)
-        # u = torch.where(bc2>=0.5, u*0.0 + 4.0*x*(1-x), u)
+        u = u.masked_fill(self.bc1_mask, 0.0)
+        u = u.masked_fill(self.bc2_mask, 1.0)
+        # x = self.inputs_tensor[:,0:1,:,:]
+        # u = torch.where(self.bc2_mask, 4.0*x*(1-x), u)
 
-        v = torch.where(torch.logical_or((bc1>=0.5),(bc2>=0.5)), v*0.0, v)
+        v = v.masked_fill(self.bc12_mask, 0.0)
 
-        p = torch.where(bc3>=0.5, p*0.0, p)
+        p = p.masked_fill(self.bc3_mask, 0.0)
 
         u_gp = self.gauss_pt_evaluation(u)
         v_gp = self.gauss_pt_evaluation(v)
         p_gp = self.gauss_pt_evaluation(p)
         p_x_gp = self.gauss_pt_evaluation_der_x(p)
         f_gp = self.gauss_pt_evaluation(f)
-        u_x_gp = self.gauss_pt_evaluation_der_x(u)
-        u_y_gp = self.gauss_pt_evaluation_der_y(u)
-        v_x_gp = self.gauss_pt_evaluation_der_x(v)
-        v_y_gp = self.gauss_pt_evaluation_der_y(v)
-
-        transformation_jacobian = self.gpw.unsqueeze(-1).unsqueeze(-1).unsqueeze(0).type_as(u_gp)
-        res_elmwise1 = transformation_jacobian * ((u_x_gp**2 + u_y_gp**2 + v_x_gp**2 + v_y_gp**2)*f_gp - p_gp*(u_x_gp + v_y_gp))**2
-        # res_elmwise1 = transformation_jacobian * ((u_x_gp**2 + v_y_gp**2)*f_gp - p_gp*(u_x_gp + v_y_gp))**2
-        # res_elmwise2 = transformation_jacobian * ((u_x_gp + v_y_gp))**2
-        res_elmwise2 = transformation_jacobian * ((p_gp*(u_x_gp + v_y_gp))**2 + 0.01*p_x_gp**2)
-
-        res_elmwise = torch.sum(res_elmwise1, 1) + 100*torch.sum(res_elmwise2, 1) 
-        loss = torch.mean(res_elmwise) 
-        return loss
-
-    def forward(self, batch):
-        inputs_tensor, forcing_tensor = batch
-        # return self.network(inputs_tensor), inputs_tensor, forcing_tensor
-        return self.network[0], inputs_tensor, forcing_tensor
+        u_x_gp, u_y_gp = self.gauss_pt_grad(u)
+        v_x_gp, v_y_gp = self.gauss_pt_grad(v)
+
+        return self._residual(f_gp, p_gp, p_x_gp, u_x_gp, u_y_gp, v_x_gp, v_y_gp, self.gpw_bcast)
+
+    def training_step(self, batch, batch_idx):
+        loss_val = self.loss(self.network[0])
+        self.log('PDE_loss', loss_val.item())
+        self.log('loss', loss_val.item())
+        return loss_val
+
+    def train_dataloader(self):
+        """
+        Index-only loader driving len(dataset) optimizer steps per epoch; the data itself lives in module buffers
+        """
+        return data.DataLoader(range(len(self.dataset)))
 
     def configure_optimizers(self):
         """
         Configure optimizer for network parameters
         """
         lr = self.learning_rate
-        opts = [torch.optim.LBFGS(self.network, lr=1.0, max_iter=5)]
+        opts = [torch.optim.LBFGS(self.network, lr=1.0, max_iter=5, line_search_fn="strong_wolfe",
+                                   tolerance_grad=1e-5, tolerance_change=1e-7)]
         # opts = [torch.optim.Adam(self.network, lr=lr)]
         schd = []
         # schd = [torch.optim.lr_scheduler.ExponentialLR(opts[0], gamma=0.7)]
@@ -135,34 +156,25 @@ class Stokes(DiffNet2DFEM):
 
 
     def on_epoch_end(self):
-        fig, axs = plt.subplots(1, 6, figsize=(2*6,1.2),
-                            subplot_kw={'aspect': 'auto'}, squeeze=True)
-        for ax in axs:
-            ax.set_xticks([])
-            ax.set_yticks([])
-        self.network.eval()
-        inputs, forcing = self.dataset[0]
+        if self.current_epoch % self.plot_every != 0 and self.current_epoch != self.trainer.max_epochs - 1:
+            return
+        self.submit_plots()
 
-        pred, inputs_tensor, forcing_tensor = self.forward((inputs.unsqueeze(0).type_as(next(self.network.parameters())), forcing.unsqueeze(0).type_as(next(self.network.parameters()))))
+    def submit_plots(self):
+        self._last_plot_epoch = self.current_epoch
+        self.network.eval()
+        pred = self.network[0]
 
-        f = forcing_tensor # renaming variable
-        
         u = pred[:,0:1,:,:]
         v = pred[:,1:2,:,:]
         p = pred[:,2:3,:,:]
 
-        # extract diffusivity and boundary conditions here
-        x = inputs_tensor[:,0:1,:,:]
-        bc1 = inputs_tensor[:,1:2,:,:]
-        bc2 = inputs_tensor[:,2:3,:,:]
-        bc3 = inputs_tensor[:,3:4,:,:]
-
         # apply boundary conditions
-        u = torch.where(bc1>=0.05, u*0.0, u)
-        u = torch.where(bc2>=0.05, u*0.0 + 1.0, u)
+        u = u.masked_fill(self.bc1_mask, 0.0)
+        u = u.masked_fill(self.bc2_mask, 1.0)
 
-        v = torch.where(torch.logical_or((bc1>=0.5),(bc2>=0.5)), v*0.0, v)
-        p = torch.where(bc3>=0.5, p*0.0, p)
+        v = v.masked_fill(self.bc12_mask, 0.0)
+        p = p.masked_fill(self.bc3_mask, 0.0)
 
         u_x = self.gauss_pt_evaluation_der_x(u)[:,0,:,:].squeeze().detach().cpu()
         v_y = self.gauss_pt_evaluation_der_y(v)[:,0,:,:].squeeze().detach().cpu()
@@ -170,57 +182,84 @@ class Stokes(DiffNet2DFEM):
         u = u.squeeze().detach().cpu()
         v = v.squeeze().detach().cpu()
         p = p.squeeze().detach().cpu()
-        bc1 = bc1.squeeze().detach().cpu()
-        bc2 = bc2.squeeze().detach().cpu()
 
         div = u_x + v_y
 
-        im0 = axs[0].imshow(u,cmap='jet', origin='lower')
-        fig.colorbar(im0, ax=axs[0])
-        im1 = axs[1].imshow(v,cmap='jet',origin='lower')
-        fig.colorbar(im1, ax=axs[1])  
-        im2 = axs[2].imshow(p,cmap='jet',origin='lower')
-        fig.colorbar(im2, ax=axs[2])
+        self._plot_futures.append(self._plot_executor.submit(self.plot_contours, self.current_epoch, u, v, p, div))
+
+    def plot_contours(self, epoch, u, v, p, div):
         x = np.linspace(0, 1, u.shape[0])
         y = np.linspace(0, 1, u.shape[1])
-
-        im3 = axs[3].imshow(np.log10(abs(div)),cmap='jet',origin='lower')
-        fig.colorbar(im3, ax=axs[3])  
-        im4 = axs[4].imshow((u**2 + v**2)**0.5,cmap='jet',origin='lower')
-        fig.colorbar(im4, ax=axs[4])
-
         xx , yy = np.meshgrid(x, y)
-        im5 = axs[5].streamplot(xx, yy, u, v, color='k', cmap='jet')
-
-        plt.savefig(os.path.join(self.logger[0].log_dir, 'contour_' + str(self.current_epoch) + '.png'))
-        self.logger[0].experiment.add_figure('Contour Plots', fig, self.current_epoch)
-        plt.close('all')
-
-
-        baseline_cut = np.array([[0.0032066932270914394, -0.0007171314741036827],
-                [-0.08300988047808777, 0.15482071713147427],
-                [-0.12839219123505985, 0.2657370517928288],
-                [-0.15676031872509966, 0.3358565737051793],
-                [-0.18517529880478095, 0.4149003984063745],
-                [-0.20523043824701204, 0.501593625498008],
-                [-0.20285211155378485, 0.5819123505976096],
-                [-0.15568717131474114, 0.664780876494024],
-                [-0.06084860557768934, 0.7336254980079682],
-                [0.08302342629482051, 0.7960956175298806],
-                [0.2402690836653384, 0.8445418326693228],
-                [0.40455490039840614, 0.8853386454183267],
-                [0.5471942629482069, 0.9159362549800798],
-                [0.670280478087649, 0.9376095617529882],
-                [0.7653800796812744, 0.9567330677290837],
-                [0.8395198406374498, 0.9682071713147412],
-                [0.9961859760956173, 0.9937051792828686]])
-
-        plt.figure()
-        plt.plot(baseline_cut[:,0], baseline_cut[:,1], 'k--', label='numerical')
-        plt.plot(yy[:,12], u[:,12], 'k:', label='DiffNet')
-        plt.legend()
-        plt.savefig(os.path.join(self.logger[0].log_dir, 'linecut_' + str(self.current_epoch) + '.png'))
-        plt.close('all')
+        fields = (u, v, p, np.log10(abs(div)), (u**2 + v**2)**0.5)
+
+        if self._plot_fig is None:
+            fig = Figure(figsize=(2*6,1.2))
+            axs = fig.subplots(1, 6, subplot_kw={'aspect': 'auto'}, squeeze=True)
+            for ax in axs:
+                ax.set_xticks([])
+                ax.set_yticks([])
+
+            ims = []
+            for ax, field in zip(axs, fields):
+                im = ax.imshow(field,cmap='jet',origin='lower')
+                fig.colorbar(im, ax=ax)
+                ims.append(im)
+            self._plot_fig, self._plot_axs, self._plot_ims = fig, axs, ims
+        else:
+            for im, field in zip(self._plot_ims, fields):
+                im.set_data(field)
+                im.autoscale()
+            # streamlines cannot be updated in place
+            self._plot_axs[5].cla()
+            self._plot_axs[5].set_xticks([])
+            self._plot_axs[5].set_yticks([])
+
+        fig = self._plot_fig
+        self._plot_axs[5].streamplot(xx, yy, u, v, color='k', cmap='jet')
+
+        fig.savefig(os.path.join(self.logger[0].log_dir, 'contour_' + str(epoch) + '.png'))
+        self.logger[0].experiment.add_figure('Contour Plots', fig, epoch, close=False)
+
+        if self._cut_fig is None:
+            baseline_cut = np.array([[0.0032066932270914394, -0.0007171314741036827],
+                    [-0.08300988047808777, 0.15482071713147427],
+                    [-0.12839219123505985, 0.2657370517928288],
+                    [-0.15676031872509966, 0.3358565737051793],
+                    [-0.18517529880478095, 0.4149003984063745],
+                    [-0.20523043824701204, 0.501593625498008],
+                    [-0.20285211155378485, 0.5819123505976096],
+                    [-0.15568717131474114, 0.664780876494024],
+                    [-0.06084860557768934, 0.7336254980079682],
+                    [0.08302342629482051, 0.7960956175298806],
+                    [0.2402690836653384, 0.8445418326693228],
+                    [0.40455490039840614, 0.8853386454183267],
+                    [0.5471942629482069, 0.9159362549800798],
+                    [0.670280478087649, 0.9376095617529882],
+                    [0.7653800796812744, 0.9567330677290837],
+                    [0.8395198406374498, 0.9682071713147412],
+                    [0.9961859760956173, 0.9937051792828686]])
+
+            fig = Figure()
+            ax = fig.subplots()
+            ax.plot(baseline_cut[:,0], baseline_cut[:,1], 'k--', label='numerical')
+            self._cut_line, = ax.plot(yy[:,12], u[:,12], 'k:', label='DiffNet')
+            ax.legend()
+            self._cut_fig = fig
+        else:
+            self._cut_line.set_data(yy[:,12], u[:,12])
+            self._cut_line.axes.relim()
+            self._cut_line.axes.autoscale_view()
+        self._cut_fig.savefig(os.path.join(self.logger[0].log_dir, 'linecut_' + str(epoch) + '.png'))
+
+    def on_train_end(self):
+        # early stopping usually ends training between plot epochs, so always plot the final state
+        if self._last_plot_epoch != self.current_epoch:
+            self.submit_plots()
+        # re-raise anything that failed on the plotting thread
+        for future in self._plot_futures:
+            future.result()
+        self._plot_executor.shutdown(wait=True)
 
 
 
@@ -247,7 +286,7 @@ def main():
 
     trainer = Trainer(gpus=[0],callbacks=[early_stopping],
         checkpoint_callback=checkpoint, logger=[logger,csv_logger],
-        max_epochs=1000, deterministic=True, profiler="simple")
+        max_epochs=1000, deterministic=False, benchmark=True, profiler="simple")
 
     # ------------------------
     # 4 Training
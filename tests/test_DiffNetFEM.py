@@ -0,0 +1,25 @@
+import pytest
+import torch
+
+from DiffNet.DiffNetFEM import DiffNet2DFEM
+
+
+@pytest.mark.parametrize("fem_basis_deg, domain_size", [(1, 9), (2, 9), (3, 10)])
+def test_gauss_pt_grad_matches_der_x_der_y(fem_basis_deg, domain_size):
+    torch.manual_seed(0)
+    network = torch.nn.ParameterList([torch.nn.Parameter(torch.zeros(1, 1, domain_size, domain_size))])
+    fem = DiffNet2DFEM(network, None, domain_size=domain_size, fem_basis_deg=fem_basis_deg)
+    u = torch.rand(2, 1, domain_size, domain_size)
+
+    u_x_gp, u_y_gp = fem.gauss_pt_grad(u)
+
+    torch.testing.assert_close(u_x_gp, fem.gauss_pt_evaluation_der_x(u))
+    torch.testing.assert_close(u_y_gp, fem.gauss_pt_evaluation_der_y(u))
+
+
+def test_gauss_pt_grad_kernels_not_in_state_dict():
+    domain_size = 9
+    network = torch.nn.ParameterList([torch.nn.Parameter(torch.zeros(1, 1, domain_size, domain_size))])
+    fem = DiffNet2DFEM(network, None, domain_size=domain_size)
+
+    assert not any(key.startswith('dN_grad_gp') for key in fem.state_dict())